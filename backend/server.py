@@ -2,6 +2,8 @@ from fastapi import FastAPI, APIRouter, HTTPException
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 import os
 import logging
 from pathlib import Path
@@ -11,6 +13,9 @@ import uuid
 from datetime import datetime, timedelta
 import random
 import asyncio
+import heapq
+import itertools
+import math
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -43,6 +48,7 @@ class Dustbin(BaseModel):
     is_full: bool = Field(default=False)
     temperature: float = Field(default=20.0)  # Celsius
     humidity: float = Field(default=50.0)  # Percentage
+    fill_rate: float = Field(default=0.0)  # smoothed fill rate, % per hour
 
 class DustbinCreate(BaseModel):
     name: str
@@ -72,6 +78,191 @@ class NotificationCreate(BaseModel):
     type: str
     priority: str = "medium"
 
+class ServiceTask(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    dustbin_id: str
+    dustbin_name: str
+    type: str  # "empty", "battery_swap", "maintenance"
+    score: float
+    location: Location
+    status: str = Field(default="pending")  # pending, assigned, completed
+    open: bool = Field(default=True)
+    crew: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    assigned_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+# Task scheduling
+TASK_TYPES = ("empty", "battery_swap", "maintenance")
+EMPTY_FILL_THRESHOLD = 75  # % fill at which a bin is queued for emptying
+EMPTY_FORECAST_HOURS = 6  # queue earlier if the bin is forecast full within this window
+FORECAST_URGENCY_MAX = 20  # most score a forecast can add on top of the fill level
+FILL_RATE_ALPHA = 0.3  # EWMA weight given to the newest fill rate sample
+FILL_RATE_MIN_GAP_HOURS = 10 / 60  # readings closer together than this are too noisy to sample
+BATTERY_SWAP_THRESHOLD = 20  # % battery
+DISTANCE_PENALTY_PER_KM = 0.5  # score points lost per km between crew and bin
+CANDIDATE_POOL_SIZE = 5  # top tasks re-ranked by distance when a crew location is given
+
+def smooth_fill_rate(dustbin: dict, fill_level: float, now: datetime) -> dict:
+    """Fold a new fill reading into the bin's EWMA fill rate, returning the fields to update"""
+    if "fill_sampled_at" not in dustbin:
+        # First reading only anchors the rate; it needs a second one to measure against
+        return {"fill_sampled_at": now, "fill_sample_level": fill_level}
+    elapsed_hours = (now - dustbin["fill_sampled_at"]).total_seconds() / 3600
+    if elapsed_hours < FILL_RATE_MIN_GAP_HOURS:
+        # Keep the previous sample as the anchor so slow rises still add up
+        return {}
+    # Emptying shows up as a drop; it says nothing about how fast the bin fills
+    sample = max(0, (fill_level - dustbin["fill_sample_level"]) / elapsed_hours)
+    fill_rate = FILL_RATE_ALPHA * sample + (1 - FILL_RATE_ALPHA) * dustbin.get("fill_rate", 0)
+    return {"fill_rate": fill_rate, "fill_sampled_at": now, "fill_sample_level": fill_level}
+
+def hours_until_full(dustbin: dict) -> Optional[float]:
+    """Forecast hours until a bin reaches 100% at its smoothed fill rate"""
+    fill_rate = dustbin.get("fill_rate", 0)
+    if fill_rate <= 0:
+        return None
+    # Readings above 100% are already full, not full "in the past"
+    return max(0, 100 - dustbin["fill_level"]) / fill_rate
+
+def score_tasks(dustbin: dict) -> dict:
+    """Work out which service tasks a bin needs and how urgent each one is"""
+    scores = {}
+    fill_level = dustbin["fill_level"]
+    eta = hours_until_full(dustbin)
+    urgency = FORECAST_URGENCY_MAX * min(1, max(0, 1 - eta / EMPTY_FORECAST_HOURS)) if eta is not None else 0
+    if fill_level >= EMPTY_FILL_THRESHOLD or urgency > 0:
+        scores["empty"] = fill_level + urgency
+
+    battery_level = dustbin["battery_level"]
+    if battery_level <= BATTERY_SWAP_THRESHOLD:
+        scores["battery_swap"] = 50 + (BATTERY_SWAP_THRESHOLD - battery_level) * 2.5
+
+    if dustbin["status"] == "offline":
+        scores["maintenance"] = 60
+    elif dustbin["status"] == "maintenance":
+        scores["maintenance"] = 40
+    return scores
+
+def distance_km(a: Location, latitude: float, longitude: float) -> float:
+    """Great-circle distance between a bin and a crew position"""
+    lat1, lat2 = math.radians(a.latitude), math.radians(latitude)
+    dlat = lat2 - lat1
+    dlng = math.radians(longitude - a.longitude)
+    h = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 12742 * math.asin(math.sqrt(h))
+
+class TaskQueue:
+    """Max-priority heap of service tasks, one per (dustbin, type).
+
+    Re-scoring pushes a fresh entry and marks the old one stale, so updates
+    stay O(log n); stale entries are dropped when they reach the top, and the
+    heap is rebuilt from the live entries once stale ones outnumber them.
+
+    The queue shared by all workers is the (status, score) index on
+    db.tasks; this heap only ranks the candidates one request pulls from it.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def push(self, task: ServiceTask):
+        current = self._entries.get((task.dustbin_id, task.type))
+        if current is not None and current[0] == -task.score:
+            current[-1] = task
+            return
+        self.discard(task.dustbin_id, task.type)
+        entry = [-task.score, next(self._counter), task]
+        self._entries[(task.dustbin_id, task.type)] = entry
+        heapq.heappush(self._heap, entry)
+
+    def discard(self, dustbin_id: str, task_type: str):
+        entry = self._entries.pop((dustbin_id, task_type), None)
+        if entry is not None:
+            entry[-1] = None
+            if len(self._heap) > 2 * len(self._entries):
+                self._compact()
+
+    def _compact(self):
+        self._heap = list(self._entries.values())
+        heapq.heapify(self._heap)
+
+    def pop(self, latitude: Optional[float] = None, longitude: Optional[float] = None) -> Optional[ServiceTask]:
+        """Remove and return the best task, re-ranking the top few by distance if a position is given"""
+        candidates = []
+        limit = CANDIDATE_POOL_SIZE if latitude is not None and longitude is not None else 1
+        while self._heap and len(candidates) < limit:
+            entry = heapq.heappop(self._heap)
+            if entry[-1] is not None:
+                candidates.append(entry)
+        if not candidates:
+            return None
+
+        if len(candidates) > 1:
+            best = max(candidates, key=lambda e: e[-1].score - DISTANCE_PENALTY_PER_KM * distance_km(e[-1].location, latitude, longitude))
+        else:
+            best = candidates[0]
+        for entry in candidates:
+            if entry is not best:
+                heapq.heappush(self._heap, entry)
+
+        task = best[-1]
+        del self._entries[(task.dustbin_id, task.type)]
+        return task
+
+def task_sync_ops(dustbin: dict, scores: dict, open_tasks: List[dict], now: datetime) -> list:
+    """Bulk write operations that bring a bin's open tasks in line with its latest scores"""
+    ops = []
+    open_by_type = {task["type"]: task for task in open_tasks}
+    for task_type in TASK_TYPES:
+        current = open_by_type.get(task_type)
+        if task_type in scores:
+            if current is None:
+                task = ServiceTask(
+                    dustbin_id=dustbin["id"],
+                    dustbin_name=dustbin["name"],
+                    type=task_type,
+                    score=scores[task_type],
+                    location=Location(**dustbin["location"]),
+                    created_at=now
+                )
+                ops.append(InsertOne(task.dict()))
+            elif current["score"] != scores[task_type]:
+                # Re-score in place; an assigned task keeps its crew
+                ops.append(UpdateOne(
+                    {"id": current["id"], "open": True},
+                    {"$set": {"score": scores[task_type], "location": dustbin["location"]}}
+                ))
+        elif current is not None:
+            # The condition has cleared; queued or assigned, the task is closed the same way
+            ops.append(UpdateOne(
+                {"id": current["id"], "open": True},
+                {"$set": {"status": "completed", "open": False, "completed_at": now}}
+            ))
+    return ops
+
+async def schedule_tasks(dustbin: dict, now: datetime):
+    """Sync a bin's open tasks with its latest reading in one read and at most one write"""
+    scores = score_tasks(dustbin)
+    for attempt in range(2):
+        open_tasks = await db.tasks.find({"dustbin_id": dustbin["id"], "open": True}).to_list(len(TASK_TYPES))
+        ops = task_sync_ops(dustbin, scores, open_tasks, now)
+        if not ops:
+            return
+        try:
+            await db.tasks.bulk_write(ops, ordered=False)
+            return
+        except BulkWriteError as e:
+            # A concurrent update opened the same task first; re-read so the retry updates it instead
+            duplicate = all(error["code"] == 11000 for error in e.details["writeErrors"])
+            if attempt or not duplicate:
+                raise
+
 # API Routes
 @api_router.get("/")
 async def root():
@@ -108,6 +299,8 @@ async def update_dustbin(dustbin_id: str, update_data: DustbinUpdate):
     
     update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
     update_dict["last_updated"] = datetime.utcnow()
+    if "fill_level" in update_dict:
+        update_dict.update(smooth_fill_rate(dustbin, update_dict["fill_level"], update_dict["last_updated"]))
     
     # Check if bin is full and create notification
     if "fill_level" in update_dict and update_dict["fill_level"] >= 90:
@@ -135,6 +328,7 @@ async def update_dustbin(dustbin_id: str, update_data: DustbinUpdate):
     
     await db.dustbins.update_one({"id": dustbin_id}, {"$set": update_dict})
     updated_dustbin = await db.dustbins.find_one({"id": dustbin_id})
+    await schedule_tasks(updated_dustbin, update_dict["last_updated"])
     return Dustbin(**updated_dustbin)
 
 @api_router.delete("/dustbins/{dustbin_id}")
@@ -143,6 +337,7 @@ async def delete_dustbin(dustbin_id: str):
     result = await db.dustbins.delete_one({"id": dustbin_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Dustbin not found")
+    await db.tasks.delete_many({"dustbin_id": dustbin_id})
     return {"message": "Dustbin deleted successfully"}
 
 @api_router.post("/notifications", response_model=Notification)
@@ -168,6 +363,58 @@ async def mark_notification_read(notification_id: str):
         raise HTTPException(status_code=404, detail="Notification not found")
     return {"message": "Notification marked as read"}
 
+@api_router.get("/tasks/next", response_model=ServiceTask)
+async def get_next_task(crew: str, latitude: Optional[float] = None, longitude: Optional[float] = None):
+    """Assign the highest priority pending task to a crew"""
+    # Mongo holds the one queue every worker sees; claims are atomic, so no
+    # task is handed to two crews and no worker needs a lock
+    claim = {"$set": {"status": "assigned", "crew": crew, "assigned_at": datetime.utcnow()}}
+    if latitude is None or longitude is None:
+        assigned = await db.tasks.find_one_and_update(
+            {"status": "pending"}, claim, sort=[("score", -1)], return_document=ReturnDocument.AFTER
+        )
+        if not assigned:
+            raise HTTPException(status_code=404, detail="No pending tasks")
+        return ServiceTask(**assigned)
+
+    while True:
+        top = await db.tasks.find({"status": "pending"}).sort("score", -1).limit(CANDIDATE_POOL_SIZE).to_list(CANDIDATE_POOL_SIZE)
+        if not top:
+            raise HTTPException(status_code=404, detail="No pending tasks")
+        candidates = TaskQueue()
+        for task in top:
+            candidates.push(ServiceTask(**task))
+        task = candidates.pop(latitude, longitude)
+        # The score check rejects a task another worker re-scored since we read it
+        assigned = await db.tasks.find_one_and_update(
+            {"id": task.id, "status": "pending", "score": task.score}, claim, return_document=ReturnDocument.AFTER
+        )
+        if assigned:
+            return ServiceTask(**assigned)
+
+@api_router.get("/tasks", response_model=List[ServiceTask])
+async def get_tasks(dustbin_id: Optional[str] = None, status: Optional[str] = None, limit: int = 50):
+    """Get service tasks, highest score first"""
+    query = {}
+    if dustbin_id:
+        query["dustbin_id"] = dustbin_id
+    if status:
+        query["status"] = status
+    tasks = await db.tasks.find(query).sort("score", -1).limit(limit).to_list(limit)
+    return [ServiceTask(**task) for task in tasks]
+
+@api_router.put("/tasks/{task_id}/complete", response_model=ServiceTask)
+async def complete_task(task_id: str):
+    """Mark a service task as done so the bin can be scheduled again"""
+    task = await db.tasks.find_one_and_update(
+        {"id": task_id, "open": True},
+        {"$set": {"status": "completed", "open": False, "completed_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not task:
+        raise HTTPException(status_code=404, detail="Open task not found")
+    return ServiceTask(**task)
+
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats():
     """Get dashboard statistics"""
@@ -237,6 +484,7 @@ async def initialize_demo_data():
     # Clear existing data
     await db.dustbins.delete_many({})
     await db.notifications.delete_many({})
+    await db.tasks.delete_many({})
     
     # Demo locations in major cities
     demo_locations = [
@@ -276,6 +524,7 @@ async def initialize_demo_data():
         dustbin_obj.is_full = dustbin_obj.fill_level >= 90
         
         await db.dustbins.insert_one(dustbin_obj.dict())
+        await schedule_tasks(dustbin_obj.dict(), dustbin_obj.last_updated)
         created_bins.append(dustbin_obj)
     
     return {"message": f"Initialized {len(created_bins)} demo dustbins", "bins": len(created_bins)}
@@ -305,4 +554,11 @@ async def shutdown_db_client():
 # Background task for IoT simulation
 @app.on_event("startup")
 async def startup_event():
+    # At most one open task per bin and type, even under concurrent updates
+    await db.tasks.create_index(
+        [("dustbin_id", 1), ("type", 1)],
+        unique=True,
+        partialFilterExpression={"open": True}
+    )
+    await db.tasks.create_index([("status", 1), ("score", -1)])
     logger.info("Smart Dustbin IoT API started successfully")
\ No newline at end of file
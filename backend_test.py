@@ -293,6 +293,129 @@ class SmartDustbinTester:
             self.log_test("Notification Generation", False, f"Error: {str(e)}")
             return False
     
+    def test_next_task(self):
+        """Test GET /api/tasks/next - Assign highest priority task to a crew"""
+        try:
+            # Re-scoring through update_dustbin should move the bin's open task
+            if self.created_dustbin_ids:
+                dustbin_id = self.created_dustbin_ids[2] if len(self.created_dustbin_ids) > 2 else self.created_dustbin_ids[0]
+                
+                def open_empty_task():
+                    tasks = self.session.get(f"{self.base_url}/tasks", params={"dustbin_id": dustbin_id}).json()
+                    return next((task for task in tasks if task["type"] == "empty" and task["open"]), None)
+                
+                self.session.put(f"{self.base_url}/dustbins/{dustbin_id}", json={"fill_level": 80.0})
+                before = open_empty_task()
+                self.session.put(f"{self.base_url}/dustbins/{dustbin_id}", json={"fill_level": 99.0})
+                after = open_empty_task()
+                if not before or not after or after["id"] != before["id"] or after["score"] <= before["score"]:
+                    self.log_test("Next Task", False, f"Task not re-scored by update: {before} -> {after}")
+                    return False
+            
+            top = self.session.get(f"{self.base_url}/tasks", params={"status": "pending", "limit": 1}).json()
+            response = self.session.get(f"{self.base_url}/tasks/next", params={"crew": "crew-1"})
+            
+            if response.status_code == 200:
+                task = response.json()
+                required_fields = ["id", "dustbin_id", "type", "score", "status", "crew"]
+                missing_fields = [field for field in required_fields if field not in task]
+                
+                if missing_fields:
+                    self.log_test("Next Task", False, f"Missing fields: {missing_fields}")
+                    return False
+                if task["status"] != "assigned" or task["crew"] != "crew-1":
+                    self.log_test("Next Task", False, f"Task not assigned to crew: {task}")
+                    return False
+                if not top or task["score"] < top[0]["score"]:
+                    self.log_test("Next Task", False, f"Expected highest scoring task {top}, got {task}")
+                    return False
+                
+                # The same task must never be handed out twice
+                second = self.session.get(f"{self.base_url}/tasks/next", params={"crew": "crew-2"})
+                if second.status_code != 200:
+                    self.log_test("Next Task", False, f"Second crew got HTTP {second.status_code}: {second.text}")
+                    return False
+                if second.json()["id"] == task["id"]:
+                    self.log_test("Next Task", False, "Same task assigned to two crews")
+                    return False
+                if second.json()["score"] > task["score"]:
+                    self.log_test("Next Task", False, "Tasks not handed out in score order")
+                    return False
+                
+                self.log_test("Next Task", True, f"Assigned {task['type']} task for {task['dustbin_name']} (score {task['score']:.1f})")
+                return True
+            else:
+                self.log_test("Next Task", False, f"HTTP {response.status_code}: {response.text}")
+                return False
+                
+        except Exception as e:
+            self.log_test("Next Task", False, f"Error: {str(e)}")
+            return False
+    
+    def test_task_lifecycle(self):
+        """Test a bin's task can be scheduled, assigned, cleared and scheduled again"""
+        try:
+            if not self.created_dustbin_ids:
+                self.log_test("Task Lifecycle", False, "No dustbin IDs available for testing")
+                return False
+            
+            dustbin_id = self.created_dustbin_ids[-1]
+            tasks_url = f"{self.base_url}/tasks"
+            
+            def pending_battery_swaps():
+                response = self.session.get(tasks_url, params={"dustbin_id": dustbin_id, "status": "pending"})
+                return [task for task in response.json() if task["type"] == "battery_swap"]
+            
+            # Start from a healthy battery, then drain it to schedule a swap
+            self.session.put(f"{self.base_url}/dustbins/{dustbin_id}", json={"battery_level": 100.0})
+            self.session.put(f"{self.base_url}/dustbins/{dustbin_id}", json={"battery_level": 5.0})
+            scheduled = pending_battery_swaps()
+            if len(scheduled) != 1:
+                self.log_test("Task Lifecycle", False, f"Expected one pending battery swap, got {scheduled}")
+                return False
+            task_id = scheduled[0]["id"]
+            
+            # Assign it by draining the queue until it comes up
+            assigned = None
+            for _ in range(100):
+                response = self.session.get(f"{tasks_url}/next", params={"crew": "lifecycle-crew"})
+                if response.status_code != 200:
+                    break
+                if response.json()["id"] == task_id:
+                    assigned = response.json()
+                    break
+            if not assigned or assigned["status"] != "assigned":
+                self.log_test("Task Lifecycle", False, "Scheduled task was never assigned")
+                return False
+            
+            # A recovered battery closes the assigned task
+            self.session.put(f"{self.base_url}/dustbins/{dustbin_id}", json={"battery_level": 100.0})
+            completed = self.session.get(tasks_url, params={"dustbin_id": dustbin_id, "status": "completed"}).json()
+            if task_id not in [task["id"] for task in completed]:
+                self.log_test("Task Lifecycle", False, "Assigned task was not closed when the battery recovered")
+                return False
+            
+            # The bin can be scheduled again, under a new task
+            self.session.put(f"{self.base_url}/dustbins/{dustbin_id}", json={"battery_level": 5.0})
+            rescheduled = pending_battery_swaps()
+            if len(rescheduled) != 1 or rescheduled[0]["id"] == task_id:
+                self.log_test("Task Lifecycle", False, f"Bin was not rescheduled: {rescheduled}")
+                return False
+            
+            # Crews can close a task explicitly, exactly once
+            first = self.session.put(f"{tasks_url}/{rescheduled[0]['id']}/complete")
+            second = self.session.put(f"{tasks_url}/{rescheduled[0]['id']}/complete")
+            if first.status_code != 200 or first.json()["status"] != "completed" or second.status_code != 404:
+                self.log_test("Task Lifecycle", False, f"Complete returned {first.status_code} then {second.status_code}")
+                return False
+            
+            self.log_test("Task Lifecycle", True, "Task scheduled, assigned, cleared, rescheduled and completed")
+            return True
+            
+        except Exception as e:
+            self.log_test("Task Lifecycle", False, f"Error: {str(e)}")
+            return False
+    
     def run_all_tests(self):
         """Run all backend tests in sequence"""
         print("🧪 Starting Smart Dustbin IoT Backend API Tests")
@@ -310,6 +433,8 @@ class SmartDustbinTester:
             ("IoT Simulation", self.test_iot_simulation),
             ("Get Notifications", self.test_notifications),
             ("Notification Generation", self.test_notification_generation),
+            ("Next Task", self.test_next_task),
+            ("Task Lifecycle", self.test_task_lifecycle),
         ]
         
         passed = 0
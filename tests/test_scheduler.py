@@ -0,0 +1,198 @@
+"""
+Unit tests for the service task scheduler: scoring, fill-rate forecasting and the priority queue.
+These run without a server or database.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from pymongo import InsertOne, UpdateOne
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from server import (  # noqa: E402
+    FORECAST_URGENCY_MAX,
+    Location,
+    ServiceTask,
+    TaskQueue,
+    score_tasks,
+    smooth_fill_rate,
+    task_sync_ops,
+)
+
+NEW_YORK = (40.7580, -73.9855)
+LOS_ANGELES = (34.0195, -118.4912)
+
+
+def make_bin(**overrides):
+    dustbin = {"fill_level": 30.0, "battery_level": 90.0, "status": "online", "fill_rate": 0.0}
+    dustbin.update(overrides)
+    return dustbin
+
+
+def make_task(dustbin_id, score, position=NEW_YORK, task_type="empty"):
+    return ServiceTask(
+        dustbin_id=dustbin_id,
+        dustbin_name=dustbin_id,
+        type=task_type,
+        score=score,
+        location=Location(latitude=position[0], longitude=position[1], address=dustbin_id),
+    )
+
+
+def test_healthy_bin_needs_no_tasks():
+    assert score_tasks(make_bin()) == {}
+
+
+def test_each_condition_schedules_its_task():
+    assert score_tasks(make_bin(fill_level=80.0)) == {"empty": 80.0}
+    assert score_tasks(make_bin(battery_level=10.0)) == {"battery_swap": 75.0}
+    assert score_tasks(make_bin(status="offline")) == {"maintenance": 60}
+    assert score_tasks(make_bin(status="maintenance")) == {"maintenance": 40}
+
+
+def test_lower_battery_scores_higher():
+    low = score_tasks(make_bin(battery_level=15.0))["battery_swap"]
+    empty = score_tasks(make_bin(battery_level=0.0))["battery_swap"]
+    assert empty > low
+
+
+def test_forecast_urgency_is_clamped():
+    rising = score_tasks(make_bin(fill_level=60.0, fill_rate=1000.0))["empty"]
+    assert 60.0 < rising <= 60.0 + FORECAST_URGENCY_MAX
+    assert rising < score_tasks(make_bin(fill_level=95.0))["empty"]
+
+
+def test_overfull_reading_keeps_urgency_clamped():
+    assert score_tasks(make_bin(fill_level=150.0, fill_rate=10.0))["empty"] == 150.0 + FORECAST_URGENCY_MAX
+
+
+def test_slow_fill_rate_adds_no_urgency():
+    assert score_tasks(make_bin(fill_level=60.0, fill_rate=1.0)) == {}
+
+
+def test_first_reading_seeds_the_fill_rate_anchor():
+    now = datetime.utcnow()
+    dustbin = make_bin(fill_level=60.0, last_updated=now - timedelta(minutes=1))
+    assert smooth_fill_rate(dustbin, 63.0, now) == {"fill_sampled_at": now, "fill_sample_level": 63.0}
+
+
+def test_fill_rate_ignores_readings_close_together():
+    now = datetime.utcnow()
+    dustbin = make_bin(fill_level=60.0, fill_sampled_at=now - timedelta(minutes=5), fill_sample_level=58.0)
+    assert smooth_fill_rate(dustbin, 63.0, now) == {}
+
+
+def test_frequent_readings_still_build_a_fill_rate():
+    now = datetime.utcnow()
+    dustbin = make_bin(fill_level=50.0, last_updated=now)
+    for _ in range(24):
+        now += timedelta(minutes=5)
+        dustbin["fill_level"] += 2.0  # 24% per hour
+        dustbin.update(smooth_fill_rate(dustbin, dustbin["fill_level"], now))
+    assert dustbin["fill_rate"] > 0
+    assert score_tasks(dustbin)["empty"] > dustbin["fill_level"]
+
+
+def test_fill_rate_is_smoothed():
+    now = datetime.utcnow()
+    dustbin = make_bin(fill_level=50.0, fill_sampled_at=now - timedelta(hours=1), fill_sample_level=50.0)
+    update = smooth_fill_rate(dustbin, 60.0, now)
+    assert abs(update["fill_rate"] - 3.0) < 1e-9
+    assert update["fill_sampled_at"] == now
+    assert update["fill_sample_level"] == 60.0
+
+
+def test_emptying_does_not_give_negative_fill_rate():
+    now = datetime.utcnow()
+    dustbin = make_bin(fill_level=95.0, fill_rate=4.0, fill_sampled_at=now - timedelta(hours=1), fill_sample_level=95.0)
+    assert smooth_fill_rate(dustbin, 5.0, now)["fill_rate"] >= 0
+
+
+def test_healthy_bin_without_open_tasks_needs_no_writes():
+    dustbin = make_bin(id="bin", name="bin", location={"latitude": 0.0, "longitude": 0.0, "address": "x"})
+    assert task_sync_ops(dustbin, {}, [], datetime.utcnow()) == []
+
+
+def test_new_condition_opens_a_task():
+    dustbin = make_bin(id="bin", name="bin", location={"latitude": 0.0, "longitude": 0.0, "address": "x"})
+    ops = task_sync_ops(dustbin, {"empty": 80.0}, [], datetime.utcnow())
+    assert len(ops) == 1 and isinstance(ops[0], InsertOne)
+
+
+def test_open_task_is_rescored_only_when_its_score_changes():
+    location = {"latitude": 0.0, "longitude": 0.0, "address": "x"}
+    dustbin = make_bin(id="bin", name="bin", location=location)
+    open_tasks = [{"id": "t1", "type": "empty", "score": 80.0, "status": "assigned"}]
+    assert task_sync_ops(dustbin, {"empty": 80.0}, open_tasks, datetime.utcnow()) == []
+    assert task_sync_ops(dustbin, {"empty": 90.0}, open_tasks, datetime.utcnow()) == [
+        UpdateOne({"id": "t1", "open": True}, {"$set": {"score": 90.0, "location": location}})
+    ]
+
+
+def test_cleared_tasks_are_closed_alike_whether_pending_or_assigned():
+    now = datetime.utcnow()
+    dustbin = make_bin(id="bin", name="bin", location={"latitude": 0.0, "longitude": 0.0, "address": "x"})
+    open_tasks = [
+        {"id": "t1", "type": "empty", "score": 80.0, "status": "pending"},
+        {"id": "t2", "type": "battery_swap", "score": 75.0, "status": "assigned"},
+    ]
+    close = {"$set": {"status": "completed", "open": False, "completed_at": now}}
+    assert task_sync_ops(dustbin, {}, open_tasks, now) == [
+        UpdateOne({"id": "t1", "open": True}, close),
+        UpdateOne({"id": "t2", "open": True}, close),
+    ]
+
+
+def test_queue_pops_highest_score_first():
+    queue = TaskQueue()
+    for dustbin_id, score in [("a", 80), ("b", 95), ("c", 60)]:
+        queue.push(make_task(dustbin_id, score))
+    assert [queue.pop().dustbin_id for _ in range(3)] == ["b", "a", "c"]
+    assert queue.pop() is None
+
+
+def test_rescoring_replaces_the_queued_task():
+    queue = TaskQueue()
+    queue.push(make_task("a", 50))
+    queue.push(make_task("b", 70))
+    queue.push(make_task("a", 90))
+    assert len(queue) == 2
+    assert queue.pop().score == 90
+    assert queue.pop().dustbin_id == "b"
+    assert queue.pop() is None
+
+
+def test_discarded_tasks_are_never_popped():
+    queue = TaskQueue()
+    queue.push(make_task("a", 90))
+    queue.push(make_task("a", 70, task_type="battery_swap"))
+    queue.discard("a", "empty")
+    assert queue.pop().type == "battery_swap"
+    assert queue.pop() is None
+
+
+def test_stale_entries_do_not_accumulate():
+    queue = TaskQueue()
+    queue.push(make_task("top", 100))
+    for i in range(1000):
+        queue.push(make_task("low", i % 50))
+    assert len(queue) == 2
+    assert len(queue._heap) <= 2 * len(queue) + 1
+    assert queue.pop().dustbin_id == "top"
+
+
+def test_pop_prefers_nearby_task_when_crew_location_given():
+    queue = TaskQueue()
+    queue.push(make_task("far", 95, LOS_ANGELES))
+    queue.push(make_task("near", 80, NEW_YORK))
+    assert queue.pop(*NEW_YORK).dustbin_id == "near"
+    assert queue.pop().dustbin_id == "far"
+
+
+def test_pop_without_location_ignores_distance():
+    queue = TaskQueue()
+    queue.push(make_task("far", 95, LOS_ANGELES))
+    queue.push(make_task("near", 80, NEW_YORK))
+    assert queue.pop().dustbin_id == "far"